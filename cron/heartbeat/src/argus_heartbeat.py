@@ -9,38 +9,43 @@ from contextlib import contextmanager
 from datetime import datetime
 import os
 import sys
-from urllib.parse import urlparse
-
-from pyargus.client import Client
-from pyargus.models import Incident, STATELESS
-from simple_rest_client import exceptions
+import time
 
 
 __version__ = "0.1"
-__progname__ = os.path.basename(sys.argv[0])
 __description__ = "Send heart beat to argus"
 
 
 API_VERSION = 2
 API_TEMPLATE = f"api/v{API_VERSION}/"
 DEFAULT_MESSAGE = "Beep-boop, Johnny 5 is alive!"
+DEFAULT_INTERVAL = 60
 
 
 # helpers
 
-class ValidateUrl(argparse.Action):
-    def __call__(self, parser, namespace, values, option_string=None):
-        url = urlparse(values)
-        if not (url.scheme and url.netloc):
-            parser.error(f"Please enter a valid url. Got: {values}")
-        setattr(namespace, self.dest, values)
+def _validate_url(value: str) -> str:
+    scheme, _, rest = value.partition("://")
+    netloc = rest.split("/", 1)[0]
+    if not (scheme and netloc):
+        raise argparse.ArgumentTypeError(f"Please enter a valid url. Got: {value}")
+    return value
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Please enter a positive whole number. Got: {value}")
+    return number
 
 
 def _str_localized_datetime(timestamp: datetime) -> str:
     timestamp = timestamp.isoformat()
-    pieces = timestamp.split("+")
-    if len(pieces) == 2 and pieces[-1] == "+00:00":
-        return pieces[0] + "Z"
+    if timestamp.endswith("+00:00"):
+        return timestamp[:-6] + "Z"
     return timestamp
 
 
@@ -48,6 +53,8 @@ def _str_localized_datetime(timestamp: datetime) -> str:
 
 @contextmanager
 def translate_api_error(context=None):
+    from simple_rest_client import exceptions
+
     error_msg = ""
     try:
         yield
@@ -68,15 +75,14 @@ def translate_api_error(context=None):
     if not error_msg:
         return
 
-    sys.stderr.write(error_msg + "\n")
     if context:
-        sys.stderr.write(f"More context: {context}\n")
-    sys.stderr.flush()
-
-    sys.exit(1)
+        error_msg += f"\nMore context: {context}"
+    sys.exit(error_msg)
 
 
 def push_heartbeat_incident(client, config=None):
+    from pyargus.models import Incident, STATELESS
+
     timestamp = datetime.now().astimezone()
     tags = {
         "still_alive": _str_localized_datetime(timestamp),
@@ -94,33 +100,89 @@ def push_heartbeat_incident(client, config=None):
 
 def make_argparser():
     parser = argparse.ArgumentParser(
-        prog=__progname__,
+        prog=os.path.basename(sys.argv[0]),
         description=__description__,
     )
 
-    parser.add_argument("host", help="Argus API host url (with scheme)", action=ValidateUrl)
-    parser.add_argument("token", help="Token to authenticate with")
-    parser.add_argument("-m", "--message", help="Message to send", default=DEFAULT_MESSAGE)
+    parser.add_argument(
+        "host",
+        nargs="?",
+        default=os.environ.get("ARGUS_HOST"),
+        type=_validate_url,
+        help="Argus API host url (with scheme), default: $ARGUS_HOST",
+    )
+    parser.add_argument(
+        "token",
+        nargs="?",
+        default=os.environ.get("ARGUS_TOKEN"),
+        help="Token to authenticate with, default: $ARGUS_TOKEN",
+    )
+    parser.add_argument("--version", action="version", version=__version__)
+    parser.add_argument(
+        "-m",
+        "--message",
+        help="Message to send",
+        default=os.environ.get("ARGUS_MESSAGE", DEFAULT_MESSAGE),
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, repeating every --interval seconds",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=_positive_int,
+        help="How many seconds to wait between runs in daemon mode",
+        default=DEFAULT_INTERVAL,
+    )
     return parser
 
 
 def get_config(args):
-    args.endpoint = f"{args.host}/{API_TEMPLATE}"
+    args.endpoint = f"{args.host.rstrip('/')}/{API_TEMPLATE}"
     return args
 
 
 # action!
 
 def run(args):
+    from pyargus.client import Client
+
     config = get_config(args)
     client = Client(api_root_url=config.endpoint, token=config.token)
-    with translate_api_error():
-        push_heartbeat_incident(client, config)
+    while True:
+        with translate_api_error():
+            push_heartbeat_incident(client, config)
+        if not config.daemon:
+            break
+        time.sleep(config.interval)
 
 
 def main(*rawargs):
+    argv = rawargs[0] if rawargs else sys.argv[1:]
+
+    # Answer --version without building the argument parser
+    if argv == ["--version"]:
+        print(__version__)
+        return
+
+    # Cron can pass the configuration in the environment instead, see README
+    if not argv and "ARGUS_HOST" in os.environ and "ARGUS_TOKEN" in os.environ:
+        args = argparse.Namespace(
+            host=os.environ["ARGUS_HOST"],
+            token=os.environ["ARGUS_TOKEN"],
+            message=os.environ.get("ARGUS_MESSAGE", DEFAULT_MESSAGE),
+            daemon=False,
+            interval=DEFAULT_INTERVAL,
+        )
+        run(args)
+        return
+
     parser = make_argparser()
-    args = parser.parse_args(*rawargs)
+    args = parser.parse_args(argv)
+    if not (args.host and args.token):
+        parser.error("Please give host and token, as arguments or in ARGUS_HOST and ARGUS_TOKEN")
     run(args)
 
 
@@ -9,13 +9,8 @@ from datetime import datetime
 import os
 import sys
 
-from pyargus.client import Client
-from pyargus.models import Incident, STATELESS
-from simple_rest_client import exceptions
-
 
 __version__ = "0.1"
-__progname__ = os.path.basename(sys.argv[0])
 __description__ = "Send minimalistic message to argus"
 
 
@@ -27,6 +22,8 @@ API_TEMPLATE = f"api/v{API_VERSION}/"
 
 @contextmanager
 def translate_api_error(context=None):
+    from simple_rest_client import exceptions
+
     error_msg = ""
     try:
         yield
@@ -47,15 +44,14 @@ def translate_api_error(context=None):
     if not error_msg:
         return
 
-    sys.stderr.write(error_msg + "\n")
     if context:
-        sys.stderr.write(f"More context: {context}\n")
-    sys.stderr.flush()
-
-    sys.exit(1)
+        error_msg += f"\nMore context: {context}"
+    sys.exit(error_msg)
 
 
 def push_minimalistic_incident(client, config=None):
+    from pyargus.models import Incident, STATELESS
+
     incident = Incident(
         description="Minimalistic one-off incident",
         start_time=datetime.now().astimezone(),
@@ -68,23 +64,36 @@ def push_minimalistic_incident(client, config=None):
 
 def make_argparser():
     parser = argparse.ArgumentParser(
-        prog=__progname__,
+        prog=os.path.basename(sys.argv[0]),
         description=__description__,
     )
 
-    parser.add_argument("host", help="Argus API host url (with scheme)")
-    parser.add_argument("token", help="Token to authenticate with")
+    parser.add_argument(
+        "host",
+        nargs="?",
+        default=os.environ.get("ARGUS_HOST"),
+        help="Argus API host url (with scheme), default: $ARGUS_HOST",
+    )
+    parser.add_argument(
+        "token",
+        nargs="?",
+        default=os.environ.get("ARGUS_TOKEN"),
+        help="Token to authenticate with, default: $ARGUS_TOKEN",
+    )
+    parser.add_argument("--version", action="version", version=__version__)
     return parser
 
 
 def get_config(args):
-    args.endpoint = f"{args.host}/{API_TEMPLATE}"
+    args.endpoint = f"{args.host.rstrip('/')}/{API_TEMPLATE}"
     return args
 
 
 # action!
 
 def run(args):
+    from pyargus.client import Client
+
     config = get_config(args)
     client = Client(api_root_url=config.endpoint, token=config.token)
     with translate_api_error():
@@ -92,8 +101,26 @@ def run(args):
 
 
 def main(*rawargs):
+    argv = rawargs[0] if rawargs else sys.argv[1:]
+
+    # Answer --version without building the argument parser
+    if argv == ["--version"]:
+        print(__version__)
+        return
+
+    # Cron can pass the configuration in the environment instead, see README
+    if not argv and "ARGUS_HOST" in os.environ and "ARGUS_TOKEN" in os.environ:
+        args = argparse.Namespace(
+            host=os.environ["ARGUS_HOST"],
+            token=os.environ["ARGUS_TOKEN"],
+        )
+        run(args)
+        return
+
     parser = make_argparser()
-    args = parser.parse_args(*rawargs)
+    args = parser.parse_args(argv)
+    if not (args.host and args.token):
+        parser.error("Please give host and token, as arguments or in ARGUS_HOST and ARGUS_TOKEN")
     run(args)
 
 
@@ -8,35 +8,44 @@ import argparse
 from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 import os
 import sys
-from urllib.parse import urlparse
-
-from moontool import moon
-from pyargus.client import Client
-from pyargus.models import Incident
-from simple_rest_client import exceptions
+import time
 
 
 __version__ = "0.1"
-__progname__ = os.path.basename(sys.argv[0])
 __description__ = "Send heart beat to argus"
 
 
 API_VERSION = 2
 API_TEMPLATE = f"api/v{API_VERSION}/"
+# Marks our incidents so that they can be looked up by tag
+SERVICE_TAG = "glue_service=moonphase"
 MESSAGE = "Current moon phase: {moon_phase_icon} {moon_phase_name}"
+HOUR = 3600
+DEFAULT_INTERVAL = HOUR
 
 
 # helpers
 
 
-class ValidateUrl(argparse.Action):
-    def __call__(self, parser, namespace, values, option_string=None):
-        url = urlparse(values)
-        if not (url.scheme and url.netloc):
-            parser.error(f"Please enter a valid url. Got: {values}")
-        setattr(namespace, self.dest, values)
+def _validate_url(value: str) -> str:
+    scheme, _, rest = value.partition("://")
+    netloc = rest.split("/", 1)[0]
+    if not (scheme and netloc):
+        raise argparse.ArgumentTypeError(f"Please enter a valid url. Got: {value}")
+    return value
+
+
+def _positive_int(value: str) -> int:
+    try:
+        number = int(value)
+    except ValueError:
+        number = 0
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"Please enter a positive whole number. Got: {value}")
+    return number
 
 
 # talk to source
@@ -52,11 +61,9 @@ class MoonPhase:
     timestamp: datetime
 
 
-def get_moonphase(timestamp=None):
-    if not timestamp:
-        timestamp = datetime.now(timezone.utc)
-    if not timestamp.tzinfo:
-        timestamp = timestamp.astimezone(timezone.utc)
+def _calculate_moonphase(timestamp):
+    from moontool import moon
+
     mc = moon.mooncal(timestamp)
     mp = moon.moonphase(timestamp)
     moonphase = MoonPhase(
@@ -70,11 +77,29 @@ def get_moonphase(timestamp=None):
     return moonphase
 
 
+_calculate_hourly_moonphase = lru_cache(maxsize=1)(_calculate_moonphase)
+
+
+def get_moonphase(timestamp=None, hourly=False):
+    if not timestamp:
+        timestamp = datetime.now(timezone.utc)
+    if not timestamp.tzinfo:
+        timestamp = timestamp.astimezone(timezone.utc)
+    if hourly:
+        # For frequent runs: the moon phase changes over days, so calculating
+        # it for the start of the hour and reusing that is close enough
+        hour = timestamp.replace(minute=0, second=0, microsecond=0)
+        return _calculate_hourly_moonphase(hour)
+    return _calculate_moonphase(timestamp)
+
+
 # argus API
 
 
 @contextmanager
 def translate_api_error(context=None):
+    from simple_rest_client import exceptions
+
     error_msg = ""
     try:
         yield
@@ -95,22 +120,43 @@ def translate_api_error(context=None):
     if not error_msg:
         return
 
-    sys.stderr.write(error_msg + "\n")
     if context:
-        sys.stderr.write(f"More context: {context}\n")
-    sys.stderr.flush()
+        error_msg += f"\nMore context: {context}"
+    sys.exit(error_msg)
 
-    sys.exit(1)
 
+def share_connection_pool(client):
+    # pyargus gives every API resource its own httpx client, so incidents and
+    # events would otherwise each open and keep their own connections
+    import httpx
 
-def get_last_moonphase_incident(client):
-    incidents = list(client.get_my_incidents(open=True))
-    assert 0 <= len(incidents) < 2, "Too many open moon phase incidents!"
-    if not incidents:
-        return None
-    if len(incidents) == 1:
-        return incidents[0]
+    pool = httpx.Client(
+        limits=httpx.Limits(max_keepalive_connections=4, keepalive_expiry=300),
+    )
+    for name in client.api.get_resource_list():
+        resource = getattr(client.api, name)
+        resource.client.close()
+        resource.client = pool
+
+
+def _get_single_moonphase_incident(incidents):
+    incidents = (incident for incident in incidents if "moon_phase_id" in incident.tags)
+    # Stop fetching pages as soon as we know there's more than one
+    incident = next(incidents, None)
     # TBD: there's been an error, close all irrelevant incidents
+    assert next(incidents, None) is None, "Too many open moon phase incidents!"
+    return incident
+
+
+def get_last_moonphase_incident(client):
+    incident = _get_single_moonphase_incident(
+        client.get_my_incidents(open=True, tags=SERVICE_TAG, page_size=2)
+    )
+    if not incident:
+        # Incidents made by older versions of this script are not tagged, skip
+        # any other open incidents from this source while looking for them
+        incident = _get_single_moonphase_incident(client.get_my_incidents(open=True))
+    return incident
 
 
 def close_former_moonphase(client, incident, moonphase):
@@ -122,7 +168,10 @@ def close_former_moonphase(client, incident, moonphase):
 
 
 def push_changed_moonphase(client, moonphase):
+    from pyargus.models import Incident
+
     tags = {
+        "glue_service": "moonphase",
         "moon_phase_id": moonphase.id,
         "moon_phase_fraction": moonphase.phase_fraction,
         "moon_phase_name": moonphase.name,
@@ -139,12 +188,12 @@ def push_changed_moonphase(client, moonphase):
     client.post_incident(incident)
 
 
-def update_moonphase(client):
-    moonphase = get_moonphase()
+def update_moonphase(client, hourly=False):
+    moonphase = get_moonphase(hourly=hourly)
     previous_incident = get_last_moonphase_incident(client)
     if previous_incident:
         previous_phase = int(previous_incident.tags["moon_phase_id"])
-        if previous_phase == moonphase.phase:
+        if previous_phase == moonphase.id:
             # still in current moonphase
             return False, moonphase
         close_former_moonphase(client, previous_incident, moonphase)
@@ -157,18 +206,42 @@ def update_moonphase(client):
 
 def make_argparser():
     parser = argparse.ArgumentParser(
-        prog=__progname__,
+        prog=os.path.basename(sys.argv[0]),
         description=__description__,
     )
 
-    parser.add_argument("host", help="Argus API host (hostname)")
-    parser.add_argument("token", help="Token to authenticate with")
+    parser.add_argument(
+        "host",
+        nargs="?",
+        default=os.environ.get("ARGUS_HOST"),
+        type=_validate_url,
+        help="Argus API host url (with scheme), default: $ARGUS_HOST",
+    )
+    parser.add_argument(
+        "token",
+        nargs="?",
+        default=os.environ.get("ARGUS_TOKEN"),
+        help="Token to authenticate with, default: $ARGUS_TOKEN",
+    )
+    parser.add_argument("--version", action="version", version=__version__)
     parser.add_argument("-v", "--verbose", help="Output to CLI", action="store_true")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, repeating every --interval seconds",
+    )
+    parser.add_argument(
+        "-i",
+        "--interval",
+        type=_positive_int,
+        help="How many seconds to wait between runs in daemon mode",
+        default=DEFAULT_INTERVAL,
+    )
     return parser
 
 
 def get_config(args):
-    args.endpoint = f"{args.host}/{API_TEMPLATE}"
+    args.endpoint = f"{args.host.rstrip('/')}/{API_TEMPLATE}"
     return args
 
 
@@ -176,20 +249,49 @@ def get_config(args):
 
 
 def run(args):
+    from pyargus.client import Client
+
     config = get_config(args)
     client = Client(api_root_url=config.endpoint, token=config.token)
-    with translate_api_error():
-        updated, moonphase = update_moonphase(client)
-    if args.verbose:
-        if not updated:
-            sys.stdout.write(f"Moonphase is still {moonphase.name}\n")
-        else:
-            sys.stdout.write(f"Moonphase changed to {moonphase.name}\n")
+    share_connection_pool(client)
+    hourly = config.daemon and config.interval < HOUR
+    while True:
+        with translate_api_error():
+            updated, moonphase = update_moonphase(client, hourly)
+        if args.verbose:
+            if not updated:
+                sys.stdout.write(f"Moonphase is still {moonphase.name}\n")
+            else:
+                sys.stdout.write(f"Moonphase changed to {moonphase.name}\n")
+        if not config.daemon:
+            break
+        time.sleep(config.interval)
 
 
 def main():
+    argv = sys.argv[1:]
+
+    # Answer --version without building the argument parser
+    if argv == ["--version"]:
+        print(__version__)
+        return
+
+    # Cron can pass the configuration in the environment instead, see README
+    if not argv and "ARGUS_HOST" in os.environ and "ARGUS_TOKEN" in os.environ:
+        args = argparse.Namespace(
+            host=os.environ["ARGUS_HOST"],
+            token=os.environ["ARGUS_TOKEN"],
+            verbose=False,
+            daemon=False,
+            interval=DEFAULT_INTERVAL,
+        )
+        run(args)
+        return
+
     parser = make_argparser()
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
+    if not (args.host and args.token):
+        parser.error("Please give host and token, as arguments or in ARGUS_HOST and ARGUS_TOKEN")
     run(args)
 
 
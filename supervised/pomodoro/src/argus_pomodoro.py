@@ -6,31 +6,30 @@ M minutes later.
 """
 
 import argparse
+import asyncio
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 import os
 import sys
-import time
-
-from pyargus.client import Client
-from pyargus.models import Incident
-from simple_rest_client import exceptions
-import httpx
 
 
 __version__ = "0.1"
-__progname__ = os.path.basename(sys.argv[0])
 __description__ = "Pomodoro-timer as an argus glue-service"
 
 
 API_VERSION = 2
 API_TEMPLATE = f"api/v{API_VERSION}/"
+# Marks our incidents so that they can be looked up by tag
+SERVICE_TAG = "glue_service=pomodoro"
 
 
 # argus API
 
 @contextmanager
 def translate_api_error(context=None):
+    from simple_rest_client import exceptions
+    import httpx
+
     error_msg = ""
     try:
         yield
@@ -55,34 +54,63 @@ def translate_api_error(context=None):
     if not error_msg:
         return
 
-    sys.stderr.write(error_msg + "\n")
     if context:
-        sys.stderr.write(f"More context: {context}\n")
-    sys.stderr.flush()
+        error_msg += f"\nMore context: {context}"
+    sys.exit(error_msg)
+
 
-    sys.exit(1)
+async def share_connection_pool(client):
+    # pyargus gives every API resource its own httpx client, so incidents and
+    # events would otherwise each open and keep their own connections. Only
+    # requests made close together, like at startup, share a connection: the
+    # breaks are longer than any keep-alive, so each later request reconnects.
+    import httpx
 
+    pool = httpx.AsyncClient()
+    for name in client.api.get_resource_list():
+        resource = getattr(client.api, name)
+        await resource.client.aclose()
+        resource.client = pool
+    return pool
 
-def check_connection(client, config):
+
+async def check_connection(client, config):
     with translate_api_error("Failed to connect on check"):
-        next(client.get_my_incidents())
+        async for _ in client.get_my_incidents():
+            break
     if config.debug:
         print("Checking: host and token ok")
     sys.exit(0)
 
 
-def find_previous_break_incident(client):
-    incidents = list(client.get_my_incidents(open=True))
-    assert 0 <= len(incidents) < 2, "Too many open pomodoro incidents!"
-    if not incidents:
-        return None
-    if len(incidents) == 1:
-        return incidents[0]
-    # TBD: there's been an error, close all irrelevant incidents
+async def _get_single_break_incident(incidents):
+    incident = None
+    # Stop fetching pages as soon as we know there's more than one
+    async for found in incidents:
+        if "break_duration" not in found.tags:
+            continue
+        # TBD: there's been an error, close all irrelevant incidents
+        assert incident is None, "Too many open pomodoro incidents!"
+        incident = found
+    return incident
+
+
+async def find_previous_break_incident(client):
+    incident = await _get_single_break_incident(
+        client.get_my_incidents(open=True, tags=SERVICE_TAG, page_size=2)
+    )
+    if not incident:
+        # Incidents made by older versions of this script are not tagged, skip
+        # any other open incidents from this source while looking for them
+        incident = await _get_single_break_incident(client.get_my_incidents(open=True))
+    return incident
+
 
+async def start_break_incident(client, config):
+    from pyargus.models import Incident
 
-def start_break_incident(client, config):
     tags = {
+        "glue_service": "pomodoro",
         "break_duration": config.break_duration,
         "time_between_breaks": config.work_duration,
     }
@@ -91,12 +119,11 @@ def start_break_incident(client, config):
         start_time=datetime.now().astimezone(),
         tags=tags,
     )
-    client.post_incident(incident)
-    return incident
+    return await client.post_incident(incident)
 
 
-def stop_break_incident(incident, client):
-    client.resolve_incident(
+async def stop_break_incident(incident, client):
+    await client.resolve_incident(
         incident=incident.pk,
         description="Break over!",
         timestamp=datetime.now().astimezone(),
@@ -108,12 +135,13 @@ def stop_break_incident(incident, client):
 
 def make_argparser():
     parser = argparse.ArgumentParser(
-        prog=__progname__,
+        prog=os.path.basename(sys.argv[0]),
         description=__description__,
     )
 
     parser.add_argument("host", help="Argus API host url (with scheme)")
     parser.add_argument("token", help="Token to authenticate with")
+    parser.add_argument("--version", action="version", version=__version__)
     parser.add_argument(
         "-b",
         "--break-duration",
@@ -144,7 +172,7 @@ def make_argparser():
 
 
 def get_config(args):
-    args.endpoint = f"{args.host}/{API_TEMPLATE}"
+    args.endpoint = f"{args.host.rstrip('/')}/{API_TEMPLATE}"
     return args
 
 
@@ -154,15 +182,22 @@ def get_config(args):
 def run(args):
     config = get_config(args)
 
-    client = Client(api_root_url=config.endpoint, token=config.token)
+    asyncio.run(serve(config))
+
+
+async def serve(config):
+    from pyargus.async_client import AsyncClient
+
+    client = AsyncClient(api_root_url=config.endpoint, token=config.token)
 
-    if config.check:
-        check_connection(client, config)
+    async with await share_connection_pool(client):
+        if config.check:
+            await check_connection(client, config)
 
-    loop(client, config)
+        await loop(client, config)
 
 
-def loop(client, config):
+async def loop(client, config):
     break_duration = timedelta(minutes=config.break_duration)
     work_duration = timedelta(minutes=config.work_duration)
     if config.debug:
@@ -170,13 +205,15 @@ def loop(client, config):
         print("Work duration:", work_duration)
         print()
 
+    # Only ask argus at startup, afterwards we know what the current incident is
+    with translate_api_error("Failed when looking for previous incident"):
+        incident = await find_previous_break_incident(client)
+
     while True:
         now = datetime.now().astimezone()
-        with translate_api_error("Failed when looking for previous incident"):
-            incident = find_previous_break_incident(client)
         if not incident:
             with translate_api_error("Failed when creating break incident"):
-                incident = start_break_incident(client, config)
+                incident = await start_break_incident(client, config)
         break_start = incident.start_time
         break_end = break_start + break_duration
         if config.debug:
@@ -184,24 +221,32 @@ def loop(client, config):
             print("         ends at", break_end)
         if now >= break_end:
             with translate_api_error("Failed when closing break incident"):
-                stop_break_incident(incident, client)
-                time_to_sleep = work_duration.total_seconds()
-                if config.debug:
-                    print(f"Next break in {time_to_sleep} seconds")
-                    print()
-                time.sleep(time_to_sleep)
-                continue
+                await stop_break_incident(incident, client)
+            incident = None
+            time_to_sleep = work_duration.total_seconds()
+            if config.debug:
+                print(f"Next break in {time_to_sleep} seconds")
+                print()
+            await asyncio.sleep(time_to_sleep)
+            continue
         # on break!
         time_to_sleep = (break_end - now).total_seconds()
         if config.debug:
             print(f"Break over in {time_to_sleep} seconds")
             print()
-        time.sleep(time_to_sleep)
+        await asyncio.sleep(time_to_sleep)
 
 
 def main(*rawargs):
+    argv = rawargs[0] if rawargs else sys.argv[1:]
+
+    # Answer --version without building the argument parser
+    if argv == ["--version"]:
+        print(__version__)
+        return
+
     parser = make_argparser()
-    args = parser.parse_args(*rawargs)
+    args = parser.parse_args(argv)
     run(args)
 
 